@@ -6,11 +6,17 @@ Leverages the same Ollama API logic as ai.js to provide a REST API endpoint for
 
 # Import standard and third-party libraries
 import asyncio
+import hashlib
 import aiohttp  # For making async HTTP requests
-import json
-from typing import Optional
+import httpx  # HTTP/2 client used for the Claude API
+import orjson  # Fast JSON encoding/decoding
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
 from fastapi import FastAPI, HTTPException, Header  # FastAPI framework and error handling
 from fastapi.middleware.cors import CORSMiddleware  # For CORS support
+from fastapi.responses import ORJSONResponse, StreamingResponse  # Fast JSON responses and server-sent event streams
 from pydantic import BaseModel  # For request/response data validation
 import logging
 
@@ -26,16 +32,92 @@ DEFAULT_MODEL = 'mistral'  # Default AI model to use
 # DEFAULT_MODEL = 'llama3.1:8b'  # Alternative model (commented out)
 
 # Claude API Configuration
-CLAUDE_API_URL = 'https://api.anthropic.com/v1/messages'
+CLAUDE_API_BASE_URL = 'https://api.anthropic.com'
+CLAUDE_MESSAGES_PATH = '/v1/messages'
 CLAUDE_MODEL = 'claude-3-5-sonnet-20241022'  # Latest Claude 3.5 Sonnet model
+CLAUDE_MAX_TOKENS = 4000
+CLAUDE_CHAT_MODEL = 'claude-3-5-sonnet'  # Model name clients send to route a chat to Claude
+# Request parts that never change; only the API key and messages vary per request
+CLAUDE_BASE_HEADERS = {
+    "anthropic-version": "2023-06-01",
+    "Content-Type": "application/json"
+}
+CLAUDE_POST_SKELETON = {
+    "model": CLAUDE_MODEL,
+    "max_tokens": CLAUDE_MAX_TOKENS
+}
+
+# Upstream HTTP client configuration (connections are pooled for the app's lifetime)
+HTTP_TIMEOUT_SECONDS = 300  # Total time allowed for a single upstream request
+HTTP_KEEPALIVE_SECONDS = 75  # How long idle pooled connections are kept open
+OLLAMA_STATUS_INTERVAL_SECONDS = 5  # How often the cached Ollama status is refreshed
+CLAUDE_PREWARM_TIMEOUT_SECONDS = 5  # Startup connection prewarm gives up after this long
+
+# Server configuration (used when running this file directly)
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 8000
+# Worker processes, one event loop per core by default; gunicorn.conf.py reads the
+# same API_WORKERS variable. Set API_WORKERS=1 when running a single uvicorn process.
+SERVER_WORKERS = int(os.environ.get("API_WORKERS", os.cpu_count() or 1))
+SERVER_LIMIT_CONCURRENCY = 200  # Connections per worker before new ones get a fast 503
+
+# Ollama generations in flight across ALL workers; tune to the backend's GPU slots.
+# Each worker process gets an equal share (at least one, so keep API_WORKERS at or
+# below this budget for it to hold).
+OLLAMA_MAX_CONCURRENT_REQUESTS = int(os.environ.get("OLLAMA_MAX_CONCURRENT_REQUESTS", 8))
+OLLAMA_WORKER_SLOTS = max(1, OLLAMA_MAX_CONCURRENT_REQUESTS // SERVER_WORKERS)
+
+# Upstream request bodies are pre-serialized with orjson and sent with this header
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Prompts starting a fresh conversation begin with this marker (see chat-manager.js resetAIMemory)
+RESET_PROMPT_MARKER = "SYSTEM: You are starting a completely new conversation"
 
 # No server-side conversation history - stateless design
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the pooled HTTP clients on startup and close them on shutdown."""
+    # Local Ollama traffic is plain HTTP/1.1, so aiohttp is all it needs
+    app.state.ollama_http = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS),
+        connector=aiohttp.TCPConnector(limit=200, limit_per_host=100, keepalive_timeout=HTTP_KEEPALIVE_SECONDS)
+    )
+    # Claude goes over TLS; HTTP/2 lets concurrent chats share one multiplexed connection
+    app.state.anthropic = httpx.AsyncClient(
+        http2=True,
+        base_url=CLAUDE_API_BASE_URL,
+        timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=100,
+            max_keepalive_connections=50,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+        )
+    )
+    # Upstream calls currently in flight, keyed by chat_key(), so identical
+    # concurrent /chat requests share a single generation. This is per worker
+    # process: duplicates landing on different workers still run separately.
+    app.state.inflight = {}
+    # Bound concurrent Ollama generations so excess requests queue here instead of on the GPU
+    # (this worker's share of OLLAMA_MAX_CONCURRENT_REQUESTS)
+    app.state.llm_sem = asyncio.Semaphore(OLLAMA_WORKER_SLOTS)
+
+    await startup_event()
+    status_task = asyncio.create_task(monitor_ollama_status())
+    try:
+        yield
+    finally:
+        status_task.cancel()
+        await app.state.ollama_http.close()
+        await app.state.anthropic.aclose()
+
 # Initialize FastAPI app with metadata
 app = FastAPI(
     title="Recipe Navigator Chat API",
     description="FastAPI server for chat functionality using Ollama",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware to allow requests from Electron app
@@ -49,7 +131,7 @@ app.add_middleware(
 
 # Define request schema for chat endpoint
 class ChatRequest(BaseModel):
-    prompt: str  # User's prompt to the AI
+    prompt: str  # User's prompt to the AI (reset prompts must start with RESET_PROMPT_MARKER)
     model: Optional[str] = DEFAULT_MODEL  # Model to use (optional)
     reset_conversation: Optional[bool] = False  # Whether to reset conversation (no-op here)
 
@@ -59,33 +141,60 @@ class ChatResponse(BaseModel):
     conversation_history_size: int  # Always 0 (stateless)
     context_size_bytes: int  # Size of prompt in bytes
 
-async def check_ollama_status() -> bool:
+async def check_ollama_status(session: aiohttp.ClientSession) -> bool:
     """Check if Ollama is running and accessible by pinging its /api/tags endpoint."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/tags') as response:
-                return response.status == 200
+        async with session.get(f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/tags') as response:
+            return response.status == 200
     except Exception as e:
-        logger.error(f"Error checking Ollama status: {e}")
+        logger.debug(f"Error checking Ollama status: {e}")
         return False
 
-async def ask_ollama(prompt: str, model: str = DEFAULT_MODEL) -> str:
-    """Send request to Ollama API and return the AI's response."""
+async def refresh_ollama_status() -> bool:
+    """Re-check Ollama and update the cached status used on the request path."""
+    is_running = await check_ollama_status(app.state.ollama_http)
+    if is_running != getattr(app.state, "ollama_ok", is_running):
+        logger.info(f"Ollama status changed: {'connected' if is_running else 'not reachable'}")
+    app.state.ollama_ok = is_running
+    app.state.ollama_ok_ts = time.monotonic()
+    return is_running
+
+async def monitor_ollama_status():
+    """Background task that keeps the cached Ollama status fresh."""
+    while True:
+        await asyncio.sleep(OLLAMA_STATUS_INTERVAL_SECONDS)
+        await refresh_ollama_status()
+
+def mark_ollama_down(error: Exception) -> HTTPException:
+    """Flag Ollama as unavailable after a failed request and build the 503 for the client."""
+    logger.error(f"Ollama request failed: {error}")
+    app.state.ollama_ok = False
+    app.state.ollama_ok_ts = time.monotonic()
+    return HTTPException(status_code=503, detail="Ollama is not running. Please start Ollama with: ollama serve")
+
+def is_reset_prompt(prompt: str) -> bool:
+    """Check whether the prompt is a conversation reset request."""
+    # Only the start is checked so long prompts aren't scanned end to end
+    return prompt.startswith(RESET_PROMPT_MARKER)
+
+def build_ollama_payload(prompt: str, model: str, stream: bool, context_size: Optional[int] = None) -> dict:
+    """Build the /api/generate request body for Ollama."""
     # Use only the provided prompt - no server-side conversation history
     # This makes the server stateless and prevents conversation pollution
     
     # Check if this is a reset request (special SYSTEM message)
-    is_reset = "SYSTEM: You are starting a completely new conversation" in prompt
+    is_reset = is_reset_prompt(prompt)
     
-    # Log the size of the context being sent
-    context_size = len(prompt.encode('utf-8'))
+    # Log the size of the context being sent (callers that already know it pass it in)
+    if context_size is None:
+        context_size = len(prompt.encode('utf-8'))
     logger.info(f"\U0001F4CA Sending {context_size} bytes of context to AI... (Reset: {is_reset})")
     
     # Prepare the request data for Ollama
     post_data = {
         "model": model,
         "prompt": prompt,
-        "stream": False
+        "stream": stream
     }
     
     # For reset requests, add additional parameters to force a fresh start
@@ -97,92 +206,155 @@ async def ask_ollama(prompt: str, model: str = DEFAULT_MODEL) -> str:
             "repeat_penalty": 1.1  # Reset repeat penalty
         }
     
+    return post_data
+
+async def stream_ollama(session: aiohttp.ClientSession, prompt: str, model: str = DEFAULT_MODEL,
+                        context_size: Optional[int] = None) -> AsyncIterator[str]:
+    """Send a streaming request to Ollama API and yield response tokens as they arrive."""
+    post_data = build_ollama_payload(prompt, model, stream=True, context_size=context_size)
+    
     try:
-        async with aiohttp.ClientSession() as session:
+        async with app.state.llm_sem:
             async with session.post(
                 f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/generate',
-                json=post_data,
-                headers={'Content-Type': 'application/json'}
+                data=orjson.dumps(post_data),
+                headers=JSON_HEADERS
             ) as response:
                 if response.status != 200:
-                    # If Ollama returns an error status, raise HTTPException
                     raise HTTPException(status_code=500, detail=f"Ollama API error: {response.status}")
-                
-                data = await response.json()
-                
-                if 'response' in data:
-                    return data['response']
-                elif 'error' in data:
-                    raise HTTPException(status_code=500, detail=f"Ollama error: {data['error']}")
-                else:
-                    logger.error(f"Unexpected response format: {data}")
-                    raise HTTPException(status_code=500, detail="Unexpected response format from Ollama")
+            
+                # Ollama streams newline-delimited JSON objects, one per token batch.
+                # Read through to EOF even after "done" so the connection goes back to the pool
+                done = False
+                async for line in response.content:
+                    if done or not line.strip():
+                        continue
+                    data = orjson.loads(line)
+                    if 'error' in data:
+                        raise HTTPException(status_code=500, detail=f"Ollama error: {data['error']}")
+                    if data.get('response'):
+                        yield data['response']
+                    done = bool(data.get('done'))
                     
+    except aiohttp.ClientConnectionError as e:
+        raise mark_ollama_down(e)
     except aiohttp.ClientError as e:
-        logger.error(f"Request failed: {e}")
+        logger.error(f"Streaming request failed: {e}")
         raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
+
+async def ask_ollama(session: aiohttp.ClientSession, prompt: str, model: str = DEFAULT_MODEL,
+                     context_size: Optional[int] = None) -> str:
+    """Send request to Ollama API and return the AI's response."""
+    # Read the generation as a stream and keep only the text, instead of
+    # buffering Ollama's whole response body and parsing it in one go
+    try:
+        tokens = [token async for token in stream_ollama(session, prompt, model, context_size)]
+        return "".join(tokens)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-async def ask_claude(prompt: str, api_key: str) -> str:
-    """Send request to Claude API and return the AI's response."""
-    logger.info(f"🤖 Sending request to Claude API...")
-    
+def build_claude_request(prompt: str, api_key: str, stream: bool = False) -> tuple[dict, dict]:
+    """Build the request body and headers for the Claude messages API."""
     # Prepare the request data for Claude API
-    post_data = {
-        "model": CLAUDE_MODEL,
-        "max_tokens": 4000,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
+    post_data = {**CLAUDE_POST_SKELETON, "messages": [{"role": "user", "content": prompt}]}
+    if stream:
+        post_data["stream"] = True
     
-    headers = {
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01",
-        "Content-Type": "application/json"
-    }
+    headers = {**CLAUDE_BASE_HEADERS, "x-api-key": api_key}
+    
+    return post_data, headers
+
+def claude_error(status_code: int, error_text: str) -> HTTPException:
+    """Map a non-200 Claude API status to the HTTPException returned to the client."""
+    if status_code == 401:
+        logger.error("Claude API authentication failed")
+        return HTTPException(status_code=401, detail="Invalid Claude API key")
+    elif status_code == 429:
+        logger.error("Claude API rate limit exceeded")
+        return HTTPException(status_code=429, detail="Claude API rate limit exceeded")
+    else:
+        logger.error(f"Claude API error {status_code}: {error_text}")
+        return HTTPException(status_code=500, detail=f"Claude API error: {error_text}")
+
+async def ask_claude(client: httpx.AsyncClient, prompt: str, api_key: str) -> str:
+    """Send request to Claude API and return the AI's response."""
+    logger.info("🤖 Sending request to Claude API...")
+    
+    post_data, headers = build_claude_request(prompt, api_key)
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(CLAUDE_API_URL, json=post_data, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # Extract the response text from Claude's response format
-                    if "content" in data and len(data["content"]) > 0:
-                        response_text = data["content"][0]["text"]
-                        logger.info(f"✅ Claude response received ({len(response_text)} characters)")
-                        return response_text
-                    else:
-                        logger.error("Unexpected response format from Claude API")
-                        raise HTTPException(status_code=500, detail="Unexpected response format from Claude API")
-                        
-                elif response.status == 401:
-                    logger.error("Claude API authentication failed")
-                    raise HTTPException(status_code=401, detail="Invalid Claude API key")
-                elif response.status == 429:
-                    logger.error("Claude API rate limit exceeded")
-                    raise HTTPException(status_code=429, detail="Claude API rate limit exceeded")
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Claude API error {response.status}: {error_text}")
-                    raise HTTPException(status_code=500, detail=f"Claude API error: {error_text}")
-                    
-    except aiohttp.ClientError as e:
+        response = await client.post(CLAUDE_MESSAGES_PATH, content=orjson.dumps(post_data), headers=headers)
+        if response.status_code == 200:
+            data = orjson.loads(response.content)
+            
+            # Extract the response text from Claude's response format
+            if "content" in data and len(data["content"]) > 0:
+                response_text = data["content"][0]["text"]
+                logger.info(f"✅ Claude response received ({len(response_text)} characters)")
+                return response_text
+            else:
+                logger.error("Unexpected response format from Claude API")
+                raise HTTPException(status_code=500, detail="Unexpected response format from Claude API")
+        else:
+            raise claude_error(response.status_code, response.text)
+            
+    except httpx.HTTPError as e:
         logger.error(f"Claude API request failed: {e}")
         raise HTTPException(status_code=500, detail=f"Claude API request failed: {str(e)}")
+    except HTTPException:
+        # Keep the mapped status codes (e.g. 401 for a bad key) intact
+        raise
     except Exception as e:
         logger.error(f"Unexpected Claude API error: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected Claude API error: {str(e)}")
 
-@app.on_event("startup")
+async def stream_claude(client: httpx.AsyncClient, prompt: str, api_key: str) -> AsyncIterator[str]:
+    """Send a streaming request to Claude API and yield text deltas as they arrive."""
+    logger.info("🤖 Streaming request to Claude API...")
+    
+    post_data, headers = build_claude_request(prompt, api_key, stream=True)
+    
+    try:
+        async with client.stream("POST", CLAUDE_MESSAGES_PATH, content=orjson.dumps(post_data), headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise claude_error(response.status_code, response.text)
+            
+            # Claude streams server-sent events; only the data lines carry payloads
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = orjson.loads(line[5:])
+                event_type = event.get("type")
+                if event_type == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                    yield event["delta"]["text"]
+                elif event_type == "error":
+                    raise HTTPException(status_code=500, detail=f"Claude API error: {event['error'].get('message')}")
+                elif event_type == "message_stop":
+                    break
+                    
+    except httpx.HTTPError as e:
+        logger.error(f"Claude API streaming request failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Claude API request failed: {str(e)}")
+
+async def prewarm_claude_connection():
+    """Open the Claude API connection at startup so the first chat doesn't pay for DNS/TCP/TLS."""
+    try:
+        # Any response (typically 404) means the pooled connection is now established
+        await app.state.anthropic.get("/", timeout=CLAUDE_PREWARM_TIMEOUT_SECONDS)
+        logger.info("\u2705 Claude API connection prewarmed")
+    except httpx.HTTPError as e:
+        logger.warning(f"\u26A0️ Could not prewarm Claude API connection: {e}")
+
 async def startup_event():
-    """Check Ollama status on startup and log connection status."""
+    """Check Ollama status, prewarm upstream connections and log connection status."""
     logger.info("\U0001F680 Starting Recipe Navigator Chat API...")
     
-    is_running = await check_ollama_status()
+    # The Ollama status check also opens the first pooled Ollama connection
+    is_running, _ = await asyncio.gather(refresh_ollama_status(), prewarm_claude_connection())
     if not is_running:
         logger.error("\u274C Error: Ollama is not running or not accessible.")
         logger.error("Please start Ollama with: ollama serve")
@@ -204,14 +376,31 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint to verify API and Ollama connectivity."""
-    ollama_status = await check_ollama_status()
+    """Health check endpoint to report API and (cached) Ollama connectivity."""
     return {
         "status": "healthy",
-        "ollama_connected": ollama_status,
+        "ollama_connected": app.state.ollama_ok,
+        "ollama_checked_seconds_ago": round(time.monotonic() - app.state.ollama_ok_ts, 1),
         "conversation_history_size": 0  # No server-side history
     }
 
+def chat_key(model: str, prompt: str, api_key: Optional[str] = None) -> bytes:
+    """Build the key identifying duplicate chat requests (the API key is included so tenants never share results)."""
+    return hashlib.blake2b(f"{model}\0{api_key or ''}\0{prompt}".encode('utf-8'), digest_size=16).digest()
+
+async def coalesce(key: bytes, make_call: Callable[[], Awaitable[str]]) -> str:
+    """Run make_call() once for all concurrent requests with the same key and share its result."""
+    inflight = app.state.inflight
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(make_call())
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    else:
+        logger.info("\U0001F517 Joining identical in-flight request")
+    # Shield so one client disconnecting doesn't cancel the call for the others
+    return await asyncio.shield(task)
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, claude_api_key: Optional[str] = Header(None)):
     """Main chat endpoint that sends prompts to Ollama and returns responses."""
@@ -225,41 +414,94 @@ async def chat(request: ChatRequest, claude_api_key: Optional[str] = Header(None
     if not request.prompt.strip():
         raise HTTPException(status_code=400, detail="Prompt cannot be empty")
     
+    # Encode once; the size is needed for both the log line and the response
+    prompt_bytes_len = len(request.prompt.encode('utf-8'))
+    
     try:
-        logger.info(f"\U0001F916 Processing prompt: {request.prompt[:100]}{'...' if len(request.prompt) > 100 else ''}")
+        # Skip building the preview entirely when INFO logging is off
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("\U0001F916 Processing prompt: %s%s", request.prompt[:100], "..." if len(request.prompt) > 100 else "")
         
         # Route to appropriate API based on model
-        if request.model == 'claude-3-5-sonnet':
+        if request.model == CLAUDE_CHAT_MODEL:
             # Use Claude API
             if not claude_api_key:
                 raise HTTPException(status_code=400, detail="Claude API key required for Claude model")
-            response = await ask_claude(request.prompt, claude_api_key)
+            upstream = lambda: ask_claude(app.state.anthropic, request.prompt, claude_api_key)
         else:
             # Use Ollama API
-            is_running = await check_ollama_status()
-            if not is_running:
+            if not app.state.ollama_ok:
                 raise HTTPException(status_code=503, detail="Ollama is not running. Please start Ollama with: ollama serve")
-            response = await ask_ollama(request.prompt, request.model)
+            upstream = lambda: ask_ollama(app.state.ollama_http, request.prompt, request.model, prompt_bytes_len)
+        
+        # Identical concurrent prompts share one upstream call; resets always run on their own
+        if request.reset_conversation or is_reset_prompt(request.prompt):
+            response = await upstream()
+        else:
+            response = await coalesce(chat_key(request.model, request.prompt, claude_api_key), upstream)
         
         # Don't maintain conversation history on the server
         # This prevents conversation pollution between different chats
         
-        # Log the current exchange
-        logger.info("=== CURRENT EXCHANGE ===")
-        logger.info(f"User: {request.prompt}")
-        logger.info(f"AI: {response}")
-        logger.info("=========================")
+        # Log the current exchange (DEBUG only - full prompts and responses can be very large)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("=== CURRENT EXCHANGE ===")
+            logger.debug("User: %s", request.prompt)
+            logger.debug("AI: %s", response)
+            logger.debug("=========================")
         
-        return ChatResponse(
+        # All fields are built by the server, so skip re-validating them
+        return ChatResponse.model_construct(
             response=response,
             conversation_history_size=0,  # No server-side history
-            context_size_bytes=len(request.prompt.encode('utf-8'))
+            context_size_bytes=prompt_bytes_len
         )
         
+    except HTTPException:
+        # Keep upstream status codes (e.g. 503 when Ollama is down) intact
+        raise
     except Exception as e:
         logger.error(f"\u274C Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def sse_events(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    """Wrap streamed text chunks as server-sent events, reporting failures as an error event."""
+    try:
+        async for chunk in chunks:
+            yield b"data: " + orjson.dumps({'delta': chunk}) + b"\n\n"
+        yield b"event: done\ndata: {}\n\n"
+    except HTTPException as e:
+        logger.error(f"\u274C Error in chat stream: {e.detail}")
+        yield b"event: error\ndata: " + orjson.dumps({'detail': e.detail, 'status_code': e.status_code}) + b"\n\n"
+    except Exception as e:
+        # Malformed upstream frames, timeouts, etc. - report them rather than cutting the stream off
+        logger.error(f"\u274C Unexpected error in chat stream: {e!r}")
+        yield b"event: error\ndata: " + orjson.dumps({'detail': f"Unexpected error: {str(e)}", 'status_code': 500}) + b"\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, claude_api_key: Optional[str] = Header(None)):
+    """Streaming variant of /chat that forwards tokens to the client as server-sent events."""
+    # Validate input prompt
+    if not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+    
+    # Route to appropriate API based on model
+    if request.model == CLAUDE_CHAT_MODEL:
+        if not claude_api_key:
+            raise HTTPException(status_code=400, detail="Claude API key required for Claude model")
+        chunks = stream_claude(app.state.anthropic, request.prompt, claude_api_key)
+    else:
+        if not app.state.ollama_ok:
+            raise HTTPException(status_code=503, detail="Ollama is not running. Please start Ollama with: ollama serve")
+        chunks = stream_ollama(app.state.ollama_http, request.prompt, request.model)
+    
+    return StreamingResponse(
+        sse_events(chunks),
+        media_type="text/event-stream",
+        # Ask proxies not to buffer the stream so tokens reach the client immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/conversation")
 async def get_conversation():
     """Get the current conversation history (always empty/stateless)."""
@@ -278,38 +520,49 @@ async def clear_conversation():
 
 @app.post("/reset-model")
 async def reset_model():
-    """Reset the Ollama model to clear any internal state by stopping and pulling the model again."""
+    """Reset the Ollama model to clear any internal state by unloading it (pulling it again only if missing)."""
     try:
         logger.info("\U0001F501 Attempting to reset Ollama model...")
         
-        # Try to restart the model by pulling it again
-        async with aiohttp.ClientSession() as session:
-            # First, try to stop the current model (send STOP prompt)
-            try:
-                async with session.post(
-                    f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/generate',
-                    json={
-                        "model": DEFAULT_MODEL,
-                        "prompt": "STOP",
-                        "stream": False
-                    }
-                ) as response:
-                    pass  # Just try to stop any ongoing generation
-            except:
-                pass  # Ignore errors if model is not running
-            
-            # Then try to pull the model again to reset it
+        session = app.state.ollama_http
+        
+        # First, unload the model so its next use starts from a clean state
+        try:
             async with session.post(
-                f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/pull',
-                json={"name": DEFAULT_MODEL}
+                f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/generate',
+                data=orjson.dumps({
+                    "model": DEFAULT_MODEL,
+                    "keep_alive": 0
+                }),
+                headers=JSON_HEADERS
             ) as response:
-                if response.status == 200:
-                    logger.info("\u2705 Model reset successfully")
-                    return {"message": "Model reset successfully"}
-                else:
-                    logger.warning("\u26A0️ Could not reset model, but continuing...")
-                    return {"message": "Model reset attempted"}
-                    
+                pass  # Just try to unload the model
+        except:
+            pass  # Ignore errors if model is not running
+        
+        # If the model is already available locally there is nothing to pull
+        async with session.post(
+            f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/show',
+            data=orjson.dumps({"model": DEFAULT_MODEL}),
+            headers=JSON_HEADERS
+        ) as response:
+            if response.status == 200:
+                logger.info("\u2705 Model reset successfully")
+                return {"message": "Model reset successfully"}
+        
+        # Otherwise try to pull the model again to reset it
+        async with session.post(
+            f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/pull',
+            data=orjson.dumps({"name": DEFAULT_MODEL}),
+            headers=JSON_HEADERS
+        ) as response:
+            if response.status == 200:
+                logger.info("\u2705 Model reset successfully")
+                return {"message": "Model reset successfully"}
+            else:
+                logger.warning("\u26A0️ Could not reset model, but continuing...")
+                return {"message": "Model reset attempted"}
+                
     except Exception as e:
         logger.error(f"\u274C Error resetting model: {e}")
         return {"message": "Error resetting model", "error": str(e)}
@@ -318,18 +571,28 @@ async def reset_model():
 async def get_available_models():
     """Get available Ollama models by querying the /api/tags endpoint."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/tags') as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return {"models": data.get('models', [])}
-                else:
-                    raise HTTPException(status_code=500, detail="Failed to fetch models from Ollama")
+        async with app.state.ollama_http.get(f'http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/tags') as response:
+            if response.status == 200:
+                data = orjson.loads(await response.read())
+                return {"models": data.get('models', [])}
+            else:
+                raise HTTPException(status_code=500, detail="Failed to fetch models from Ollama")
     except Exception as e:
         logger.error(f"Error fetching models: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching models: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
-    # Run the FastAPI app with Uvicorn server
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info") 
\ No newline at end of file
+    # Run the FastAPI app with Uvicorn server. Multiple workers require the app
+    # as an import string; "auto" picks uvloop/httptools when they are installed
+    # and falls back to asyncio/h11 otherwise (uvloop is not available on Windows)
+    uvicorn.run(
+        "api_server:app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        loop="auto",
+        http="auto",
+        workers=SERVER_WORKERS,
+        limit_concurrency=SERVER_LIMIT_CONCURRENCY,
+        log_level="info"
+    ) 
\ No newline at end of file
@@ -0,0 +1,23 @@
+"""
+Gunicorn configuration for running the chat API across multiple workers.
+Usage (from python_code/): gunicorn api_server:app -c gunicorn.conf.py
+"""
+
+import multiprocessing
+import os
+
+# Listen on the same address/port as api_server.py
+bind = "0.0.0.0:8000"
+reuse_port = True  # Only lets the port be rebound on restart; workers share the master's socket
+
+# One async worker per core; each runs the app's lifespan and so gets its own
+# upstream connection pools (app.state.ollama_http / app.state.anthropic).
+# worker_connections is not set because UvicornWorker ignores it (the
+# limit_concurrency cap in api_server.py only applies when run directly).
+# API_WORKERS is shared with api_server.py, which splits its Ollama concurrency
+# budget (OLLAMA_MAX_CONCURRENT_REQUESTS) evenly across this many workers
+workers = int(os.environ.get("API_WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+keepalive = 75  # Seconds to hold idle client connections open
+timeout = 120  # Restart workers that stop responding for this long